@@ -1,30 +1,38 @@
 from fastapi import APIRouter, Depends, HTTPException, Form
+from pymongo.errors import DuplicateKeyError
 from database import users_collection
-from security import verify_password, hash_password, create_access_token
 from dependencies import get_current_user, require_role
-from bson import ObjectId
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from security import (
     verify_password,
     hash_password,
     create_access_token,
     create_refresh_token,
+    DUMMY_PASSWORD_HASH,
     REFRESH_TOKEN_EXPIRE_DAYS
 )
 router = APIRouter()
 
+VALID_ROLES = frozenset({"admin", "hr", "manager", "employee"})
+
 # LOGIN
 @router.post("/login")
 async def login(username: str = Form(...), password: str = Form(...)):
     user = await users_collection.find_one({"username": username})
 
-    if not user or not verify_password(password, user["password"]):
+    # Always run a hash check so unknown usernames can't be told apart
+    # from wrong passwords by response time
+    hashed = user["password"] if user else DUMMY_PASSWORD_HASH
+    password_ok = await verify_password(password, hashed)
+
+    if not user or not password_ok:
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
-    access_token = create_access_token(str(user["_id"]))
+    now = datetime.now(timezone.utc)
+    access_token = create_access_token(str(user["_id"]), now)
     refresh_token = create_refresh_token()
 
-    refresh_expiry = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    refresh_expiry = now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
 
     await users_collection.update_one(
         {"_id": user["_id"]},
@@ -50,15 +58,18 @@ async def create_user(
     role: str = Form(...),
     admin=Depends(require_role("admin"))
 ):
-    if role not in ["admin", "hr", "manager", "employee"]:
+    if role not in VALID_ROLES:
         raise HTTPException(status_code=400, detail="Invalid role")
 
-    hashed = hash_password(password)
-    await users_collection.insert_one({
-        "username": username,
-        "password": hashed,
-        "role": role
-    })
+    hashed = await hash_password(password)
+    try:
+        await users_collection.insert_one({
+            "username": username,
+            "password": hashed,
+            "role": role
+        })
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Username already exists")
     return {"message": "User created successfully"}
 
 @router.post("/refresh")
@@ -68,10 +79,11 @@ async def refresh_token(refresh_token: str = Form(...)):
     if not user:
         raise HTTPException(status_code=401, detail="Invalid refresh token")
 
-    if user.get("refresh_token_expiry") < datetime.utcnow():
+    now = datetime.now(timezone.utc)
+    if user.get("refresh_token_expiry") < now:
         raise HTTPException(status_code=401, detail="Refresh token expired")
 
-    new_access_token = create_access_token(str(user["_id"]))
+    new_access_token = create_access_token(str(user["_id"]), now)
 
     return {
         "access_token": new_access_token,
@@ -1,6 +1,93 @@
-from motor.motor_asyncio import AsyncIOMotorClient
+import logging
+from pymongo import AsyncMongoClient
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+logger = logging.getLogger(__name__)
 
 MONGO_URL = "mongodb+srv://nithish03:<password>@cluster0.zcfarfw.mongodb.net/"
-client = AsyncIOMotorClient(MONGO_URL)
+# tz_aware so stored datetimes come back comparable with datetime.now(timezone.utc)
+client = AsyncMongoClient(
+    MONGO_URL,
+    tz_aware=True,
+    # Keep warm connections so the first request after idle skips TCP/TLS/auth
+    maxPoolSize=50,
+    minPoolSize=10,
+    maxIdleTimeMS=60000,
+    # Fail fast instead of queueing requests behind a saturated pool or
+    # an unreachable cluster
+    waitQueueTimeoutMS=5000,
+    serverSelectionTimeoutMS=3000,
+    retryWrites=True,
+    # zlib ships with Python; zstd/snappy would need extra packages
+    compressors="zlib"
+)
 db = client.company_db
 users_collection = db.users
+
+
+async def find_duplicate_usernames() -> list:
+    cursor = await users_collection.aggregate([
+        {"$group": {"_id": "$username", "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ])
+    return [group["_id"] for group in await cursor.to_list(None)]
+
+
+async def ensure_username_index():
+    """
+    Builds the unique username index. Users created before usernames were
+    enforced unique may share one; then the duplicates are logged and a
+    plain index is kept instead, so the service still starts. Once they
+    are resolved, the next start replaces it with the unique index.
+    """
+
+    try:
+        await users_collection.create_index([("username", 1)], unique=True)
+        return
+    except DuplicateKeyError:
+        pass
+    except OperationFailure as e:
+        # A plain username_1 left by an earlier start with duplicates
+        if e.code not in (85, 86):
+            raise
+        if not await find_duplicate_usernames():
+            try:
+                await users_collection.drop_index("username_1")
+            except OperationFailure:
+                pass  # Another worker dropped it first
+            return await ensure_username_index()
+
+    logger.error(
+        "Duplicate usernames %s prevent the unique username index; using a "
+        "non-unique index until they are renamed or removed",
+        await find_duplicate_usernames()
+    )
+    await users_collection.create_index([("username", 1)])
+
+
+async def ensure_indexes():
+    # Login and refresh look users up by these fields on every call, and
+    # create_task looks assignees up by username alone, so usernames must
+    # identify one user
+    await ensure_username_index()
+    await users_collection.create_index([("refresh_token", 1)], sparse=True)
+
+    # Managers list their own projects on every dashboard/projects request
+    await db.projects.create_index([("manager_id", 1)])
+
+    # Per-project task lookups/aggregations and status counts
+    await db.tasks.create_index([("project_id", 1), ("status", 1)])
+
+    # Paged task lists match on equality fields then sort by _id:
+    # {project_id} (admin/manager project view), {assigned_to} (/tasks/my)
+    # and {assigned_to, project_id} (employee project view, also the
+    # employee's distinct project ids)
+    await db.tasks.create_index([("project_id", 1), ("_id", 1)])
+    await db.tasks.create_index([("assigned_to", 1), ("_id", 1)])
+    await db.tasks.create_index(
+        [("assigned_to", 1), ("project_id", 1), ("_id", 1)]
+    )
+
+    # A task's full comment thread, oldest first; project deletions
+    await db.task_comments.create_index([("task_id", 1), ("created_at", 1)])
+    await db.task_comments.create_index([("project_id", 1)])
@@ -1,23 +1,117 @@
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
-from jose import jwt, JWTError
+import jwt
 from database import users_collection
 from security import SECRET_KEY, ALGORITHM
 from bson import ObjectId
+from pydantic import PlainValidator
+from typing import Annotated
+import time
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
 
+def parse_object_id(value: str) -> ObjectId:
+    if not ObjectId.is_valid(value):
+        raise ValueError("Invalid id")
+    return ObjectId(value)
+
+# Path parameter type for document ids: malformed ids are rejected with a
+# 422 before the handler runs, and handlers receive a ready ObjectId
+ObjectIdPath = Annotated[
+    ObjectId, PlainValidator(parse_object_id, json_schema_input_type=str)
+]
+
+class TTLCache:
+    """
+    Small bounded cache whose entries expire `ttl` seconds after being set,
+    or earlier if given an expiry time. Expired entries are dropped on
+    read and from the front of the insertion order on every write; when
+    still full, the least recently set entry is evicted.
+    """
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries = {}
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            del self.entries[key]
+            return None
+        return entry[1]
+
+    def set(self, key, value, expires_at: float = None):
+        now = time.time()
+        expires = now + self.ttl
+        if expires_at is not None:
+            expires = min(expires, expires_at)
+
+        # Re-insert so the entry moves to the end of the insertion order
+        self.entries.pop(key, None)
+
+        # Entries share one TTL, so the front of the insertion order
+        # expires first
+        while self.entries:
+            first = next(iter(self.entries))
+            if self.entries[first][0] > now:
+                break
+            del self.entries[first]
+
+        if len(self.entries) >= self.max_size:
+            del self.entries[next(iter(self.entries))]
+
+        self.entries[key] = (expires, value)
+
+# Users by id, kept briefly so every authenticated request doesn't need a
+# users lookup. Role changes and deletions take effect after the TTL.
+user_cache = TTLCache(ttl=30, max_size=10_000)
+
+# Verified token -> user id, so a client's burst of requests with the same
+# token is only decoded once. Entries never outlive the token's own exp.
+token_cache = TTLCache(ttl=30, max_size=10_000)
+
+def decode_user_id(token: str):
+    user_id = token_cache.get(token)
+    if user_id:
+        return user_id
+
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    user_id = payload.get("sub")
+
+    if user_id:
+        token_cache.set(token, user_id, expires_at=payload["exp"])
+
+    return user_id
+
+async def load_user(user_id: str):
+    user = user_cache.get(user_id)
+    if user:
+        return user
+
+    # Only the fields handlers use; keeps hashes/tokens out of the cache
+    user = await users_collection.find_one(
+        {"_id": ObjectId(user_id)},
+        {"username": 1, "role": 1}
+    )
+
+    if user:
+        user_cache.set(user_id, user)
+
+    return user
+
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = payload.get("sub")
+        user_id = decode_user_id(token)
         if not user_id:
             raise HTTPException(status_code=401)
-        user = await users_collection.find_one({"_id": ObjectId(user_id)})
+        user = await load_user(user_id)
         if not user:
             raise HTTPException(status_code=401)
         return user
-    except JWTError:
+    except jwt.PyJWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
 def require_role(role: str):
@@ -1,33 +1,59 @@
+import asyncio
+import os
+import uvicorn
 from fastapi import FastAPI, Request, Depends
+from pymongo.errors import DuplicateKeyError
+from fastapi.responses import ORJSONResponse
 from fastapi.templating import Jinja2Templates
-from database import users_collection
+from database import users_collection, ensure_indexes
 from security import hash_password
 from auth import router
 from dependencies import get_current_user
 from projects import router as project_router
 from tasks import router as task_router
-from tasks import tasks_collection
+from tasks import tasks_collection, backfill_comments
 from projects import projects_collection
-from progress_calculator import calculate_project_progress
 
 
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 templates = Jinja2Templates(directory="templates")
 
 app.include_router(router)
 app.include_router(project_router)
 app.include_router(task_router)
+# CREATE MONGODB INDEXES ON STARTUP
+# Registered first: startup hooks run in order, so the unique username
+# index exists before the admin user is created
+@app.on_event("startup")
+async def create_indexes():
+    await ensure_indexes()
+
+# MOVE PRE-EXISTING TASK COMMENTS INTO task_comments ON STARTUP
+# Every worker runs this; per-task claims keep concurrent runs from copying
+# a comment twice, and once finished it is a single marker lookup
+@app.on_event("startup")
+async def migrate_comments():
+    await backfill_comments()
+
 # CREATE DEFAULT ADMIN ON STARTUP
 @app.on_event("startup")
 async def create_admin():
     admin = await users_collection.find_one({"username": "admin"})
     if not admin:
-        await users_collection.insert_one({
-            "username": "admin",
-            "password": hash_password("admin123"),
-            "role": "admin"
-        })
+        # Several workers may start together; the unique username index
+        # lets only one upsert insert, the others fail with a duplicate key
+        try:
+            await users_collection.update_one(
+                {"username": "admin"},
+                {"$setOnInsert": {
+                    "password": await hash_password("admin123"),
+                    "role": "admin"
+                }},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            pass
 
 # DASHBOARD
 @app.get("/dashboard")
@@ -38,41 +64,71 @@ async def dashboard(request: Request, user=Depends(get_current_user)):
     )
 
 
+async def count_tasks(match: dict) -> dict:
+    """
+    Counts the tasks matching `match` and how many of them are completed
+    in a single aggregation, without transferring the task documents.
+    """
+
+    cursor = await tasks_collection.aggregate([
+        {"$match": match},
+        {"$group": {
+            "_id": None,
+            "total": {"$sum": 1},
+            "completed": {"$sum": {"$cond": [
+                {"$eq": ["$status", "Completed"]}, 1, 0
+            ]}}
+        }}
+    ])
+    counts = await cursor.to_list(1)
+
+    return counts[0] if counts else {"total": 0, "completed": 0}
+
+
 @app.get("/dashboard/summary")
 async def dashboard_summary(user=Depends(get_current_user)):
 
     if user["role"] == "admin":
-        projects = await projects_collection.find().to_list(None)
-        tasks = await tasks_collection.find().to_list(None)
+        total_projects, counts = await asyncio.gather(
+            projects_collection.count_documents({}),
+            count_tasks({})
+        )
 
     elif user["role"] == "manager":
-        projects = await projects_collection.find(
-            {"manager_id": user["_id"]}
-        ).to_list(None)
-
-        project_ids = [project["_id"] for project in projects]
+        project_ids = await projects_collection.distinct(
+            "_id", {"manager_id": user["_id"]}
+        )
 
-        tasks = await tasks_collection.find(
-            {"project_id": {"$in": project_ids}}
-        ).to_list(None)
+        total_projects = len(project_ids)
+        counts = await count_tasks({"project_id": {"$in": project_ids}})
 
     else:  # employee
-        tasks = await tasks_collection.find(
-            {"assigned_to": user["_id"]}
-        ).to_list(None)
-
-        completed = len([t for t in tasks if t["status"] == "Completed"])
+        counts = await count_tasks({"assigned_to": user["_id"]})
 
         return {
-            "total_tasks": len(tasks),
-            "completed_tasks": completed,
-            "pending_tasks": len(tasks) - completed
+            "total_tasks": counts["total"],
+            "completed_tasks": counts["completed"],
+            "pending_tasks": counts["total"] - counts["completed"]
         }
 
-    completed = len([t for t in tasks if t["status"] == "Completed"])
-
     return {
-        "total_projects": len(projects),
-        "total_tasks": len(tasks),
-        "completed_tasks": completed
-    }
\ No newline at end of file
+        "total_projects": total_projects,
+        "total_tasks": counts["total"],
+        "completed_tasks": counts["completed"]
+    }
+
+if __name__ == "__main__":
+    # uvloop + httptools (from uvicorn[standard]) instead of the asyncio/h11 defaults
+    if os.getenv("DEV") == "1":
+        # Single auto-reloading worker for local development
+        uvicorn.run("main:app", loop="uvloop", http="httptools", reload=True)
+    else:
+        uvicorn.run(
+            "main:app",
+            host="0.0.0.0",
+            port=8000,
+            workers=os.cpu_count(),
+            loop="uvloop",
+            http="httptools",
+            log_level="info"
+        )
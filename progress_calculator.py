@@ -1,22 +1,23 @@
-def calculate_project_progress(tasks: list) -> float:
+def progress_expression(total_weight: str, completed_weight: str) -> dict:
     """
-    Calculates project progress based on completed task weights.
-    Only tasks with status == "Completed" contribute.
+    MongoDB aggregation expression for project progress: the percentage of
+    total task weight held by "Completed" tasks, rounded to 2 decimals and
+    0.0 when the total is 0. Takes field paths holding the total and
+    completed task weights.
     """
 
-    if not tasks:
-        return 0.0
-
-    total_weight = sum(task.get("weight", 0) for task in tasks)
-
-    if total_weight == 0:
-        return 0.0
-
-    completed_weight = sum(
-        task.get("weight", 0)
-        for task in tasks
-        if task.get("status") == "Completed"
-    )
-
-    progress = (completed_weight / total_weight) * 100
-    return round(progress, 2)
\ No newline at end of file
+    return {
+        "$cond": [
+            {"$eq": [total_weight, 0]},
+            0.0,
+            {
+                "$round": [
+                    {"$multiply": [
+                        {"$divide": [completed_weight, total_weight]},
+                        100
+                    ]},
+                    2
+                ]
+            }
+        ]
+    }
@@ -1,14 +1,29 @@
+import asyncio
+import orjson
 from fastapi import APIRouter, Depends, HTTPException
-from datetime import datetime
+from fastapi.responses import StreamingResponse
+from datetime import datetime, timezone
 from bson import ObjectId
 from database import db
-from dependencies import get_current_user, require_role
-from progress_calculator import calculate_project_progress
+from dependencies import ObjectIdPath, get_current_user, require_role
+from progress_calculator import progress_expression
 
 router = APIRouter(prefix="/projects", tags=["Projects"])
 
 projects_collection = db.projects
 tasks_collection = db.tasks
+comments_collection = db.task_comments
+
+# Fields a manager may change, in update_project's parameter order
+PROJECT_UPDATE_FIELDS = ("name", "description", "deadline")
+
+
+def serialize_object_id(value):
+    # orjson fallback: called only for types it cannot encode natively
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError
+
 
 @router.post("/")
 async def create_project(
@@ -23,7 +38,7 @@ async def create_project(
         "manager_id": user["_id"],
         "deadline": deadline,
         "status": "Active",
-        "created_at": datetime.utcnow()
+        "created_at": datetime.now(timezone.utc)
     }
 
     result = await projects_collection.insert_one(project)
@@ -38,52 +53,96 @@ async def create_project(
 async def get_projects(user=Depends(get_current_user)):
 
     if user["role"] == "admin":
-        projects = await projects_collection.find().to_list(None)
+        match = {}
 
     elif user["role"] == "manager":
-        projects = await projects_collection.find(
-            {"manager_id": user["_id"]}
-        ).to_list(None)
+        match = {"manager_id": user["_id"]}
 
     else:  # employee
-        tasks = await tasks_collection.find(
-            {"assigned_to": user["_id"]}
-        ).to_list(None)
-
-        project_ids = list({task["project_id"] for task in tasks})
-
-        projects = await projects_collection.find(
-            {"_id": {"$in": project_ids}}
-        ).to_list(None)
-
-    final_projects = []
-
-    for project in projects:
-
-        # Get tasks for this project
-        tasks = await tasks_collection.find(
-            {"project_id": project["_id"]}
-        ).to_list(None)
+        project_ids = await tasks_collection.distinct(
+            "project_id", {"assigned_to": user["_id"]}
+        )
+        match = {"_id": {"$in": project_ids}}
+
+    # Join tasks and calculate progress in MongoDB (one round-trip)
+    cursor = await projects_collection.aggregate([
+        {"$match": match},
+        {"$lookup": {
+            "from": "tasks",
+            "localField": "_id",
+            "foreignField": "project_id",
+            "pipeline": [{"$project": {"weight": 1, "status": 1}}],
+            "as": "tasks"
+        }},
+        {"$addFields": {
+            "total_weight": {"$sum": "$tasks.weight"},
+            "completed_weight": {"$sum": {"$map": {
+                "input": "$tasks",
+                "as": "t",
+                "in": {"$cond": [
+                    {"$eq": ["$$t.status", "Completed"]}, "$$t.weight", 0
+                ]}
+            }}}
+        }},
+        {"$addFields": {
+            "progress": progress_expression("$total_weight", "$completed_weight")
+        }},
+        {"$project": {"tasks": 0, "total_weight": 0, "completed_weight": 0}}
+    ])
+
+    # Stream the JSON array as the cursor yields documents instead of
+    # materializing the whole result first. The cursor is closed even if
+    # the client disconnects mid-stream.
+    async def stream():
+        async with cursor:
+            yield b"["
+            separator = b""
+            async for project in cursor:
+                yield separator + orjson.dumps(
+                    project, default=serialize_object_id
+                )
+                separator = b","
+            yield b"]"
+
+    return StreamingResponse(stream(), media_type="application/json")
+
+async def get_task_stats(project_id: ObjectId, user_id: ObjectId) -> dict:
+    """
+    Aggregates a project's tasks into its progress and whether user_id
+    is assigned to any of them, without transferring the task documents.
+    """
+
+    cursor = await tasks_collection.aggregate([
+        {"$match": {"project_id": project_id}},
+        {"$group": {
+            "_id": None,
+            "total_weight": {"$sum": "$weight"},
+            "completed_weight": {"$sum": {"$cond": [
+                {"$eq": ["$status", "Completed"]}, "$weight", 0
+            ]}},
+            "assigned": {"$max": {"$eq": ["$assigned_to", user_id]}}
+        }},
+        {"$project": {
+            "_id": 0,
+            "progress": progress_expression("$total_weight", "$completed_weight"),
+            "assigned": 1
+        }}
+    ])
+    stats = await cursor.to_list(1)
+
+    # No tasks yet
+    return stats[0] if stats else {"progress": 0.0, "assigned": False}
 
-        # Calculate progress
-        progress = calculate_project_progress(tasks)
-
-        # Serialize ObjectIds
-        project["_id"] = str(project["_id"])
-        project["manager_id"] = str(project["manager_id"])
-        project["progress"] = progress
-
-        final_projects.append(project)
-
-    return final_projects
 
 @router.get("/{project_id}")
 async def get_single_project(
-    project_id: str,
+    project_id: ObjectIdPath,
     user=Depends(get_current_user)
 ):
-    project = await projects_collection.find_one(
-        {"_id": ObjectId(project_id)}
+    # The task stats only need the id, so fetch them alongside the project
+    project, stats = await asyncio.gather(
+        projects_collection.find_one({"_id": project_id}),
+        get_task_stats(project_id, user["_id"])
     )
 
     if not project:
@@ -95,36 +154,33 @@ async def get_single_project(
             raise HTTPException(status_code=403, detail="Not authorized")
 
     elif user["role"] == "employee":
-        task = await tasks_collection.find_one({
-            "project_id": project["_id"],
-            "assigned_to": user["_id"]
-        })
-        if not task:
+        if not stats["assigned"]:
             raise HTTPException(status_code=403, detail="Not authorized")
 
-    # Fetch tasks for progress calculation
-    tasks = await tasks_collection.find(
-        {"project_id": project["_id"]}
-    ).to_list(None)
-
-    progress = calculate_project_progress(tasks)
-
     project["_id"] = str(project["_id"])
     project["manager_id"] = str(project["manager_id"])
-    project["progress"] = progress
+    project["progress"] = stats["progress"]
 
     return project
 
 @router.patch("/{project_id}")
 async def update_project(
-    project_id: str,
+    project_id: ObjectIdPath,
     name: str = None,
     description: str = None,
     deadline: str = None,
     user=Depends(require_role("manager"))
 ):
+    values = (name, description, deadline)
+    update_data = {
+        field: value
+        for field, value in zip(PROJECT_UPDATE_FIELDS, values)
+        # All text fields; empty values are ignored as before
+        if value
+    }
+
     project = await projects_collection.find_one(
-        {"_id": ObjectId(project_id)}
+        {"_id": project_id}
     )
 
     if not project:
@@ -133,14 +189,8 @@ async def update_project(
     if project["manager_id"] != user["_id"]:
         raise HTTPException(status_code=403, detail="Not authorized")
 
-    update_data = {}
-
-    if name:
-        update_data["name"] = name
-    if description:
-        update_data["description"] = description
-    if deadline:
-        update_data["deadline"] = deadline
+    if not update_data:
+        return {"message": "No changes"}
 
     await projects_collection.update_one(
         {"_id": project["_id"]},
@@ -154,19 +204,20 @@ async def update_project(
 
 @router.delete("/{project_id}")
 async def delete_project(
-    project_id: str,
+    project_id: ObjectIdPath,
     user=Depends(require_role("admin"))
 ):
     project = await projects_collection.find_one(
-        {"_id": ObjectId(project_id)}
+        {"_id": project_id}
     )
 
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
 
-    # Delete tasks under project
-    await tasks_collection.delete_many(
-        {"project_id": project["_id"]}
+    # Delete tasks under project, and their comment threads
+    await asyncio.gather(
+        tasks_collection.delete_many({"project_id": project["_id"]}),
+        comments_collection.delete_many({"project_id": project["_id"]})
     )
 
     # Delete project
@@ -1,6 +1,10 @@
-from passlib.context import CryptContext
-from datetime import datetime, timedelta
-from jose import jwt
+import asyncio
+import base64
+import hashlib
+import os
+import bcrypt
+from datetime import datetime, timedelta, timezone
+import jwt
 import secrets
 
 SECRET_KEY = "SUPER_SECRET_KEY_CHANGE_ME"
@@ -9,16 +13,55 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 15
 REFRESH_TOKEN_EXPIRE_DAYS = 7
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Work factor for new hashes; existing hashes keep the cost they were made with
+BCRYPT_COST = int(os.getenv("BCRYPT_COST", "12"))
 
-def hash_password(password: str):
-    return pwd_context.hash(password)
+# New hashes are bcrypt over a SHA-256 prehash so passwords longer than
+# bcrypt's 72-byte limit are not silently truncated; the marker tells them
+# apart from plain bcrypt hashes made before
+PREHASH_PREFIX = b"sha256$"
 
-def verify_password(password: str, hashed: str):
-    return pwd_context.verify(password, hashed)
+def _prehash(password: str):
+    # base64 keeps the digest free of NUL bytes, which bcrypt stops at
+    return base64.b64encode(hashlib.sha256(password.encode()).digest())
 
-def create_access_token(user_id: str):
-    expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+def _hash_password_sync(password: str):
+    # Stored as bytes (BSON binary), bcrypt's native format
+    return PREHASH_PREFIX + bcrypt.hashpw(
+        _prehash(password), bcrypt.gensalt(BCRYPT_COST)
+    )
+
+def _verify_password_sync(password: str, hashed: bytes | str):
+    # Hashes written by the old passlib setup are "$2b$..." strings
+    if isinstance(hashed, str):
+        hashed = hashed.encode()
+    # checkpw compares in constant time
+    if hashed.startswith(PREHASH_PREFIX):
+        return bcrypt.checkpw(
+            _prehash(password), hashed[len(PREHASH_PREFIX):]
+        )
+    return bcrypt.checkpw(password.encode(), hashed)
+
+# Checked against when a login names an unknown user, so that case costs the
+# same bcrypt work as a wrong password
+DUMMY_PASSWORD_HASH = _hash_password_sync(secrets.token_urlsafe(16))
+
+# bcrypt is CPU-bound for tens to hundreds of ms; run it in the default
+# thread pool so the event loop keeps serving other requests meanwhile
+async def hash_password(password: str):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, _hash_password_sync, password)
+
+async def verify_password(password: str, hashed: bytes | str):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        None, _verify_password_sync, password, hashed
+    )
+
+def create_access_token(user_id: str, now: datetime = None):
+    if now is None:
+        now = datetime.now(timezone.utc)
+    expire = now + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     return jwt.encode(
         {"sub": user_id, "exp": expire},
         SECRET_KEY,
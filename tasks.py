@@ -1,19 +1,202 @@
-from fastapi import APIRouter, Depends, HTTPException
-from datetime import datetime
+import asyncio
+import hmac
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import ORJSONResponse
+from datetime import datetime, timezone
 from bson import ObjectId
 
 from database import db
-from dependencies import get_current_user, require_role
+from dependencies import ObjectIdPath, get_current_user, require_role
 
 router = APIRouter(prefix="/tasks", tags=["Tasks"])
 
 tasks_collection = db.tasks
 projects_collection = db.projects
 users_collection = db.users
+comments_collection = db.task_comments
+migrations_collection = db.migrations
+
+# Marker written once every pre-existing task's comments are in task_comments
+COMMENTS_MIGRATION = "task_comments_backfill"
+
+TASK_STATUSES = frozenset({"To-Do", "In Progress", "Completed"})
+
+# Tasks embed only their most recent comments; the full thread lives in
+# task_comments and is served by GET /tasks/{task_id}/comments
+MAX_EMBEDDED_COMMENTS = 50
+
+# Text fields a manager may change, in manager_update_task's parameter order
+TASK_UPDATE_TEXT_FIELDS = ("title", "description", "priority", "deadline")
+
+# Task fields returned by the list endpoints, with ObjectIds already
+# converted to strings by MongoDB. The results contain only types orjson
+# encodes natively, so the endpoints return them as an ORJSONResponse
+# directly and skip FastAPI's jsonable_encoder pass.
+TASK_FIELDS = {
+    "_id": {"$toString": "$_id"},
+    "project_id": {"$toString": "$project_id"},
+    "assigned_to": {"$toString": "$assigned_to"},
+    "title": 1,
+    "description": 1,
+    "status": 1,
+    "weight": 1,
+    "priority": 1,
+    "deadline": 1,
+    "created_at": 1,
+    # Tasks from before comment_count was kept have every comment embedded
+    "comment_count": {"$ifNull": [
+        "$comment_count", {"$size": {"$ifNull": ["$comments", []]}}
+    ]},
+    "comments": {"$map": {
+        "input": {"$ifNull": ["$comments", []]},
+        "as": "c",
+        "in": {
+            "commented_by": {"$toString": "$$c.commented_by"},
+            # Resolved from the users joined in by find_tasks
+            "commented_by_username": {"$let": {
+                "vars": {"commenter": {"$first": {"$filter": {
+                    "input": "$commenters",
+                    "as": "u",
+                    "cond": {"$eq": ["$$u._id", "$$c.commented_by"]}
+                }}}},
+                "in": "$$commenter.username"
+            }},
+            "text": "$$c.text",
+            "created_at": "$$c.created_at"
+        }
+    }}
+}
+
+# Joins each comment's author, for the comments list
+COMMENTER_LOOKUP = {"$lookup": {
+    "from": "users",
+    "localField": "commented_by",
+    "foreignField": "_id",
+    "pipeline": [{"$project": {"username": 1}}],
+    "as": "commenter"
+}}
+
+COMMENT_FIELDS = {
+    "_id": 0,
+    "commented_by": {"$toString": "$commented_by"},
+    "commented_by_username": {"$first": "$commenter.username"},
+    "text": 1,
+    "created_at": 1
+}
+
+# Summary view: no description, comments or commenter join
+TASK_SUMMARY_FIELDS = {
+    "_id": {"$toString": "$_id"},
+    "project_id": {"$toString": "$project_id"},
+    "assigned_to": {"$toString": "$assigned_to"},
+    "title": 1,
+    "status": 1,
+    "priority": 1,
+    "deadline": 1
+}
+
+
+async def find_tasks(
+    match: dict,
+    summary: bool = False,
+    skip: int = 0,
+    limit: int = 50
+) -> list:
+    # Page before joining/projecting so only `limit` tasks are processed
+    pipeline = [
+        {"$match": match},
+        {"$sort": {"_id": 1}},
+        {"$skip": skip},
+        {"$limit": limit}
+    ]
+
+    if summary:
+        pipeline.append({"$project": TASK_SUMMARY_FIELDS})
+    else:
+        pipeline += [
+            # One join for all commenters instead of a user lookup per comment
+            {"$lookup": {
+                "from": "users",
+                "localField": "comments.commented_by",
+                "foreignField": "_id",
+                "pipeline": [{"$project": {"username": 1}}],
+                "as": "commenters"
+            }},
+            {"$project": TASK_FIELDS}
+        ]
+
+    cursor = await tasks_collection.aggregate(pipeline)
+    return await cursor.to_list(limit)
+
+
+async def backfill_task_comments(task_id: ObjectId):
+    """
+    Moves one task from before task_comments and comment_count existed onto
+    that layout, so the capped push in add_comment can't drop comments kept
+    nowhere else. Seeding comment_count and reading the embedded comments
+    are one atomic update, so only one caller ever copies a task's comments.
+    """
+
+    task = await tasks_collection.find_one_and_update(
+        {"_id": task_id, "comment_count": {"$exists": False}},
+        [{"$set": {
+            "comment_count": {"$size": {"$ifNull": ["$comments", []]}}
+        }}],
+        projection={"project_id": 1, "comments": 1}
+    )
+
+    # Already migrated, or nothing to copy
+    if not task or not task.get("comments"):
+        return
+
+    await comments_collection.insert_many([
+        {"task_id": task["_id"], "project_id": task["project_id"], **comment}
+        for comment in task["comments"]
+    ])
+
+
+async def backfill_comments():
+    """
+    Migrates every task still without comment_count, then records that in
+    the migrations collection so later startups skip the scan.
+    """
+
+    if await migrations_collection.find_one({"_id": COMMENTS_MIGRATION}):
+        return
+
+    cursor = tasks_collection.find(
+        {"comment_count": {"$exists": False}}, {"_id": 1}
+    )
+
+    async for task in cursor:
+        await backfill_task_comments(task["_id"])
+
+    await migrations_collection.update_one(
+        {"_id": COMMENTS_MIGRATION},
+        {"$set": {"completed_at": datetime.now(timezone.utc)}},
+        upsert=True
+    )
+
+
+async def raise_task_not_found_or_forbidden(task_id: ObjectId):
+    """
+    Called when an update filtered on both the task id and the caller's
+    authorization matched nothing, to tell the two cases apart.
+    """
+
+    exists = await tasks_collection.count_documents(
+        {"_id": task_id}, limit=1
+    )
+
+    if not exists:
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    raise HTTPException(status_code=403, detail="Not authorized")
+
 
 @router.post("/project/{project_id}")
 async def create_task(
-    project_id: str,
+    project_id: ObjectIdPath,
     title: str,
     description: str,
     assigned_username: str,
@@ -22,11 +205,17 @@ async def create_task(
     deadline: str,
     user=Depends(require_role("manager"))
 ):
-    # Validate project exists
-    project = await projects_collection.find_one(
-        {"_id": ObjectId(project_id)}
+    # Project and employee lookups are independent, run them concurrently
+    project, employee = await asyncio.gather(
+        projects_collection.find_one({"_id": project_id}),
+        # Same query whether or not the user is an employee; the role is
+        # checked below
+        users_collection.find_one(
+            {"username": assigned_username}, {"role": 1}
+        )
     )
 
+    # Validate project exists
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
 
@@ -35,11 +224,8 @@ async def create_task(
         raise HTTPException(status_code=403, detail="Not authorized")
 
     # Validate employee
-    employee = await users_collection.find_one(
-        {"username": assigned_username, "role": "employee"}
-    )
-
-    if not employee:
+    role = (employee or {}).get("role", "")
+    if not hmac.compare_digest(role, "employee"):
         raise HTTPException(status_code=404, detail="Employee not found")
 
     if weight <= 0:
@@ -55,7 +241,8 @@ async def create_task(
         "priority": priority,
         "deadline": deadline,
         "comments": [],
-        "created_at": datetime.utcnow()
+        "comment_count": 0,
+        "created_at": datetime.now(timezone.utc)
     }
 
     result = await tasks_collection.insert_one(task)
@@ -67,157 +254,195 @@ async def create_task(
 
 @router.patch("/{task_id}/status")
 async def update_status(
-    task_id: str,
+    task_id: ObjectIdPath,
     status: str,
     user=Depends(get_current_user)
 ):
-    task = await tasks_collection.find_one(
-        {"_id": ObjectId(task_id)}
+    if status not in TASK_STATUSES:
+        raise HTTPException(status_code=400, detail="Invalid status")
+
+    # Update task; only its assignee may, so the check is part of the filter
+    task = await tasks_collection.find_one_and_update(
+        {"_id": task_id, "assigned_to": user["_id"]},
+        {"$set": {"status": status}},
+        projection={"project_id": 1}
     )
 
     if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
+        await raise_task_not_found_or_forbidden(task_id)
 
-    if task["assigned_to"] != user["_id"]:
-        raise HTTPException(status_code=403, detail="Not authorized")
-
-    if status not in ["To-Do", "In Progress", "Completed"]:
-        raise HTTPException(status_code=400, detail="Invalid status")
+    # 🔥 AUTO PROJECT STATUS UPDATE
+    project_id = task["project_id"]
 
-    # Update task
-    await tasks_collection.update_one(
-        {"_id": task["_id"]},
-        {"$set": {"status": status}}
+    # The task just updated exists, so the project has tasks; only need
+    # to know whether any of them is still not completed
+    remaining = await tasks_collection.count_documents(
+        {"project_id": project_id, "status": {"$ne": "Completed"}},
+        limit=1
     )
 
-    # 🔥 AUTO PROJECT STATUS UPDATE
-    project_id = task["project_id"]
+    new_status = "Completed" if remaining == 0 else "Active"
 
-    project_tasks = await tasks_collection.find(
-        {"project_id": project_id}
-    ).to_list(None)
+    await projects_collection.update_one(
+        {"_id": project_id},
+        {"$set": {"status": new_status}}
+    )
 
-    if project_tasks:  # only if tasks exist
-        all_completed = all(
-            t["status"] == "Completed" for t in project_tasks
-        )
+    return {"message": "Status updated successfully"}
 
-        new_status = "Completed" if all_completed else "Active"
 
-        await projects_collection.update_one(
-            {"_id": project_id},
-            {"$set": {"status": new_status}}
-        )
 
-    return {"message": "Status updated successfully"}
+async def find_task_with_manager(task_id: ObjectId) -> dict:
+    """
+    Fetches a task's assignee and project, together with the project's
+    manager, in one round-trip. Raises 404 if either is missing.
+    """
+
+    cursor = await tasks_collection.aggregate([
+        {"$match": {"_id": task_id}},
+        {"$limit": 1},
+        {"$lookup": {
+            "from": "projects",
+            "localField": "project_id",
+            "foreignField": "_id",
+            "pipeline": [{"$project": {"manager_id": 1}}],
+            "as": "project"
+        }},
+        {"$unwind": "$project"},
+        {"$project": {
+            "project_id": 1,
+            "assigned_to": 1,
+            "comment_count": 1,
+            "project.manager_id": 1
+        }}
+    ])
+    tasks = await cursor.to_list(1)
+
+    if not tasks:
+        raise HTTPException(status_code=404, detail="Task not found")
 
+    return tasks[0]
 
 
 @router.post("/{task_id}/comment")
 async def add_comment(
-    task_id: str,
+    task_id: ObjectIdPath,
     text: str,
     user=Depends(get_current_user)
 ):
-    task = await tasks_collection.find_one(
-        {"_id": ObjectId(task_id)}
-    )
-
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
+    task = await find_task_with_manager(task_id)
 
     # Employee must be assigned OR manager must own project
-    project = await projects_collection.find_one(
-        {"_id": task["project_id"]}
-    )
-
     if not (
         task["assigned_to"] == user["_id"] or
-        project["manager_id"] == user["_id"]
+        task["project"]["manager_id"] == user["_id"]
     ):
         raise HTTPException(status_code=403, detail="Not authorized")
 
+    # Not migrated yet (see backfill_task_comments): copy its comments out
+    # before the capped push below can trim any
+    if "comment_count" not in task:
+        await backfill_task_comments(task["_id"])
+
     comment = {
         "commented_by": user["_id"],
         "text": text,
-        "created_at": datetime.utcnow()
+        "created_at": datetime.now(timezone.utc)
     }
 
-    await tasks_collection.update_one(
-        {"_id": task["_id"]},
-        {"$push": {"comments": comment}}
+    # Keep the full thread separately; the task keeps only the latest
+    # comments so its size stays bounded
+    await asyncio.gather(
+        comments_collection.insert_one({
+            "task_id": task["_id"],
+            "project_id": task["project_id"],
+            **comment
+        }),
+        tasks_collection.update_one(
+            {"_id": task["_id"]},
+            {
+                "$push": {"comments": {
+                    "$each": [comment],
+                    "$slice": -MAX_EMBEDDED_COMMENTS
+                }},
+                "$inc": {"comment_count": 1}
+            }
+        )
     )
 
     return {"message": "Comment added"}
 
+
+@router.get("/{task_id}/comments")
+async def get_comments(
+    task_id: ObjectIdPath,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=200),
+    user=Depends(get_current_user)
+):
+    task = await find_task_with_manager(task_id)
+
+    # RBAC (admin sees every task's comments)
+    if user["role"] == "manager":
+        if task["project"]["manager_id"] != user["_id"]:
+            raise HTTPException(status_code=403, detail="Not authorized")
+
+    elif user["role"] == "employee":
+        if task["assigned_to"] != user["_id"]:
+            raise HTTPException(status_code=403, detail="Not authorized")
+
+    cursor = await comments_collection.aggregate([
+        {"$match": {"task_id": task["_id"]}},
+        {"$sort": {"created_at": 1}},
+        {"$skip": skip},
+        {"$limit": limit},
+        COMMENTER_LOOKUP,
+        {"$project": COMMENT_FIELDS}
+    ])
+    return ORJSONResponse(await cursor.to_list(limit))
+
 @router.get("/project/{project_id}")
 async def get_tasks_by_project(
-    project_id: str,
+    project_id: ObjectIdPath,
+    summary: bool = False,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=200),
     user=Depends(get_current_user)
 ):
     project = await projects_collection.find_one(
-        {"_id": ObjectId(project_id)}
+        {"_id": project_id}
     )
 
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
 
-    # RBAC
+    match = {"project_id": project["_id"]}
+
+    # RBAC (admin sees every task of the project)
     if user["role"] == "manager":
         if project["manager_id"] != user["_id"]:
             raise HTTPException(status_code=403, detail="Not authorized")
 
-        tasks = await tasks_collection.find(
-            {"project_id": ObjectId(project_id)}
-        ).to_list(None)
-
     elif user["role"] == "employee":
-        tasks = await tasks_collection.find(
-            {
-                "project_id": ObjectId(project_id),
-                "assigned_to": user["_id"]
-            }
-        ).to_list(None)
+        match["assigned_to"] = user["_id"]
 
-    else:  # admin
-        tasks = await tasks_collection.find(
-            {"project_id": ObjectId(project_id)}
-        ).to_list(None)
-
-    # Serialize everything safely
-    for task in tasks:
-        task["_id"] = str(task["_id"])
-        task["project_id"] = str(task["project_id"])
-        task["assigned_to"] = str(task["assigned_to"])
-
-        for comment in task.get("comments", []):
-            comment["commented_by"] = str(comment["commented_by"])
-
-    return tasks
+    return ORJSONResponse(await find_tasks(match, summary, skip, limit))
 
 
 @router.get("/my")
-async def get_my_tasks(user=Depends(require_role("employee"))):
-
-    tasks = await tasks_collection.find(
-        {"assigned_to": user["_id"]}
-    ).to_list(None)
-
-    for task in tasks:
-        task["_id"] = str(task["_id"])
-        task["project_id"] = str(task["project_id"])
-        task["assigned_to"] = str(task["assigned_to"])
-
-        # 🔥 FIX FOR COMMENTS
-        for comment in task.get("comments", []):
-            comment["commented_by"] = str(comment["commented_by"])
-
-    return tasks
+async def get_my_tasks(
+    summary: bool = False,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=200),
+    user=Depends(require_role("employee"))
+):
+    tasks = await find_tasks({"assigned_to": user["_id"]}, summary, skip, limit)
+    return ORJSONResponse(tasks)
 
 
 @router.patch("/{task_id}")
 async def manager_update_task(
-    task_id: str,
+    task_id: ObjectIdPath,
     title: str = None,
     description: str = None,
     weight: int = None,
@@ -225,36 +450,35 @@ async def manager_update_task(
     deadline: str = None,
     user=Depends(require_role("manager"))
 ):
-    task = await tasks_collection.find_one(
-        {"_id": ObjectId(task_id)}
-    )
+    values = (title, description, priority, deadline)
+    update_data = {
+        field: value
+        for field, value in zip(TASK_UPDATE_TEXT_FIELDS, values)
+        # Empty text values are ignored
+        if value
+    }
 
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
+    if weight is not None:
+        if weight <= 0:
+            raise HTTPException(status_code=400, detail="Weight must be > 0")
+        update_data["weight"] = weight
 
-    project = await projects_collection.find_one(
-        {"_id": task["project_id"]}
-    )
+    # Task and its project's manager in one query (404 if missing)
+    task = await find_task_with_manager(task_id)
 
-    if project["manager_id"] != user["_id"]:
+    if task["project"]["manager_id"] != user["_id"]:
         raise HTTPException(status_code=403, detail="Not authorized")
 
-    update_data = {}
+    if not update_data:
+        return {"message": "No changes"}
 
-    if title:
-        update_data["title"] = title
-    if description:
-        update_data["description"] = description
-    if weight is not None:
-        update_data["weight"] = weight
-    if priority:
-        update_data["priority"] = priority
-    if deadline:
-        update_data["deadline"] = deadline
-
-    await tasks_collection.update_one(
-        {"_id": task["_id"]},
+    # Filtering on the project that was checked keeps the write tied to it
+    result = await tasks_collection.update_one(
+        {"_id": task["_id"], "project_id": task["project_id"]},
         {"$set": update_data}
     )
 
+    if not result.matched_count:
+        raise HTTPException(status_code=404, detail="Task not found")
+
     return {"message": "Task updated successfully"}
\ No newline at end of file